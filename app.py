@@ -9,7 +9,9 @@
 #     Created by rUv
 # /app.py
 
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import RedirectResponse
 from fastapi.openapi.docs import get_swagger_ui_html
 from fastapi.staticfiles import StaticFiles
@@ -19,9 +21,28 @@ from routers.misc_router import router as misc_router
 from routers.bedrock_router import router as bedrock_router
 from routers.management_router import management_router
 from routers.users import router as users_router   
-from deployment.aws.deploy import deploy_router
+from deployment.aws.deploy import deploy_router, ensure_docker_running
+from services.aws_services import get_account_id
+from utils.aws_utils import configure_ecr_credential_helper
+import logging
+import os
 import subprocess
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    try:
+        await ensure_docker_running()
+    except HTTPException:
+        logging.warning("Docker daemon is not running; deployments will fail until it is started.")
+    # Let docker push fetch ECR credentials itself instead of logging in on every deploy
+    try:
+        region = os.getenv("AWS_DEFAULT_REGION", "us-west-2")
+        account_id = await run_in_threadpool(get_account_id)
+        await run_in_threadpool(configure_ecr_credential_helper, f"{account_id}.dkr.ecr.{region}.amazonaws.com")
+    except Exception as e:
+        logging.warning(f"Skipping ECR credential helper setup: {e}")
+    yield
+
 app = FastAPI(
     title="Agile Agents",
     description="This is the Agile Agents API documentation.",
@@ -38,6 +59,7 @@ app = FastAPI(
     openapi_url="/api/v1/openapi.json",
     docs_url=None,
     redoc_url=None,
+    lifespan=lifespan,
 )
 
 @app.get("/", include_in_schema=False)
@@ -1,160 +1,343 @@
 import os
+import io
+import hashlib
+import asyncio
+import shutil
 import subprocess
 import json
-import boto3
+import tarfile
+import tempfile
+import time
+import logging
+import docker
+from botocore.exceptions import ClientError
 from fastapi import APIRouter, HTTPException, File, UploadFile
+from fastapi.concurrency import run_in_threadpool
 from models.base_models import DeployRequest, AdvancedDeployRequest
 from services.aws_services import (
-    get_aws_client,
+    get_account_id,
+    get_ecr_credentials,
+    tag_ecr_image,
+    get_docker_client,
+    tag_and_push_image,
     ensure_iam_role,
     create_ecr_repository,
+    forget_ecr_repository,
     push_docker_image_to_ecr,
     create_or_update_lambda_function,
 )
+from utils.aws_utils import configure_ecr_credential_helper
 from typing import List, Optional  # Add this import
-import uuid  # Add this import to generate unique filenames
 
 deploy_router = APIRouter()
 
-# Function to install AWS CLI
-async def install_aws_cli():
-    subprocess.run(["curl", "https://awscli.amazonaws.com/awscli-exe-linux-x86_64.zip", "-o", "awscliv2.zip"], check=True)
-    subprocess.run(["unzip", "awscliv2.zip"], check=True)
-    subprocess.run(["sudo", "./aws/install"], check=True)
-    subprocess.run(["rm", "-rf", "awscliv2.zip", "aws"], check=True)
+# Bound on concurrent build+push pipelines sharing the local docker daemon
+BUILD_SEM = asyncio.Semaphore(int(os.getenv("MAX_CONCURRENT_BUILDS", "2")))
+
+# Chunk size used when streaming uploaded files to disk
+UPLOAD_CHUNK_SIZE = 1 << 20
+
+# Copy uploads spooled to disk with copy_file_range(2) so the data never passes through user space
+ZERO_COPY_UPLOADS = hasattr(os, "copy_file_range") and os.getenv("ZERO_COPY_UPLOADS", "true").lower() == "true"
+
+# Function to check whether an uploaded file is backed by a real file descriptor
+def is_on_disk(source) -> bool:
+    if isinstance(source, tempfile.SpooledTemporaryFile):
+        # Calling fileno() would force small in-memory uploads out to disk
+        return source._rolled
+    try:
+        source.fileno()
+        return True
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        return False
+
+# Function to stream an uploaded file to disk in constant memory
+def save_upload(file: UploadFile, destination: str):
+    source = file.file
+    source.seek(0)
+    with open(destination, "wb") as file_object:
+        if ZERO_COPY_UPLOADS and is_on_disk(source):
+            try:
+                while os.copy_file_range(source.fileno(), file_object.fileno(), UPLOAD_CHUNK_SIZE * 64):
+                    pass
+                return
+            except OSError:
+                # Unsupported by the kernel or filesystem; start over with a buffered copy
+                source.seek(0)
+                file_object.seek(0)
+                file_object.truncate()
+        shutil.copyfileobj(source, file_object, UPLOAD_CHUNK_SIZE)
+
+# Base image for /deploy functions; pulled once and kept in the local daemon
+LAMBDA_BASE_IMAGE = "public.ecr.aws/lambda/python:3.8"
+# Working directory of the Lambda base image that handlers are loaded from
+LAMBDA_TASK_ROOT = "/var/task"
+# Platform of /deploy images; functions are created with the default x86_64 architecture
+LAMBDA_PLATFORM = "linux/amd64"
+
+# Dockerfile for /deploy images; the syntax directive must be the very first line
+DEPLOY_DOCKERFILE = (
+    b"# syntax=docker/dockerfile:1.4\n"
+    b"FROM " + LAMBDA_BASE_IMAGE.encode() + b"\n"
+    b"COPY requirements.txt .\n"
+    b"RUN --mount=type=cache,target=/root/.cache/pip pip install -r requirements.txt\n"
+    b"COPY app.py .\n"
+    b'CMD ["app.lambda_handler"]\n'
+)
+
+# Function to derive an image tag from everything that goes into a /deploy image
+def content_tag(python_script, requirements):
+    digest = hashlib.sha256()
+    for part in (python_script.encode(), requirements.encode(), DEPLOY_DOCKERFILE):
+        # Length-prefix each part so different splits of the same bytes hash differently
+        digest.update(len(part).to_bytes(8, "big"))
+        digest.update(part)
+    return f"sha256-{digest.hexdigest()[:16]}"
+
+# Function to write a file with a single writev(2) call
+def write_file(path, *chunks):
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        written = os.writev(fd, chunks)
+        remaining = b"".join(chunks)[written:]
+        while remaining:
+            remaining = remaining[os.write(fd, remaining):]
+    finally:
+        os.close(fd)
+
+# Function to pack in-memory files into an uncompressed tar archive
+def make_tar(files):
+    buf = io.BytesIO()
+    with tarfile.open(fileobj=buf, mode="w") as tar:
+        for name, data in files.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            # Fixed mtime so identical files always produce the same layer digest
+            info.mtime = 0
+            tar.addfile(info, io.BytesIO(data))
+    return buf.getvalue()
+
+# Function to build a script-only image by committing app.py onto the base image, skipping docker build
+def commit_script_image(python_script, repository, tag):
+    client = get_docker_client()
+    try:
+        base_image = client.images.get(LAMBDA_BASE_IMAGE)
+    except docker.errors.ImageNotFound:
+        base_image = None
+    if base_image is None or base_image.attrs.get("Architecture") != LAMBDA_PLATFORM.split("/")[1]:
+        # A missing base, or one cached for the host architecture (e.g. arm64), would not run on the function
+        base_image = client.images.pull(LAMBDA_BASE_IMAGE, platform=LAMBDA_PLATFORM)
+    container = client.containers.create(base_image.id)
+    try:
+        container.put_archive(LAMBDA_TASK_ROOT, make_tar({"app.py": python_script.encode()}))
+        container.commit(repository=repository, tag=tag, changes=['CMD ["app.lambda_handler"]'])
+    finally:
+        container.remove()
+
+# Environment for docker invocations that should go through BuildKit
+BUILDKIT_ENV = {"DOCKER_BUILDKIT": "1"}
+
+# Function to build the docker command for a single BuildKit session that builds, tags and pushes to ECR
+def build_command(image_uris, context_dir, cache_ref, export_cache=False):
+    command = [
+        "docker", "buildx", "build",
+        "--platform", LAMBDA_PLATFORM,
+        # Attestations turn the push into an OCI image index, which Lambda rejects as an unsupported media type
+        "--provenance=false",
+        "--sbom=false",
+        "--cache-from", f"type=registry,ref={cache_ref}",
+    ]
+    if export_cache:
+        # ECR only accepts cache manifests in the OCI image format; a failed cache export must not fail the deploy
+        command += ["--cache-to", f"type=registry,ref={cache_ref},mode=max,image-manifest=true,oci-mediatypes=true,ignore-error=true"]
+    for image_uri in image_uris:
+        command += ["--tag", image_uri]
+    return command + [
+        "--push",
+        context_dir
+    ]
+
+# Text ECR puts in push errors when the target repository is missing
+MISSING_REPOSITORY_ERROR = "does not exist"
+
+# Function to run a command without blocking the event loop
+async def run_subprocess(args, input=None, env=None):
+    proc = await asyncio.create_subprocess_exec(
+        *args,
+        stdin=asyncio.subprocess.PIPE if input is not None else None,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        env={**os.environ, **env} if env else None
+    )
+    if isinstance(input, str):
+        input = input.encode()
+    try:
+        stdout, stderr = await proc.communicate(input)
+    except asyncio.CancelledError:
+        # Don't leave the command running after the request that started it is gone
+        proc.kill()
+        await proc.wait()
+        raise
+    if proc.returncode != 0:
+        raise subprocess.CalledProcessError(proc.returncode, args, output=stdout.decode(), stderr=stderr.decode())
+    return stdout.decode()
+
+# Seconds a successful `docker info` probe stays valid
+DOCKER_CHECK_TTL = 30
+# time.monotonic() of the last successful probe, None until the daemon has been seen
+docker_checked_at = None
+
+# Function to ensure the Docker daemon is reachable, probing it at most once per DOCKER_CHECK_TTL
+async def ensure_docker_running():
+    global docker_checked_at
+    now = time.monotonic()
+    if docker_checked_at is not None and now - docker_checked_at < DOCKER_CHECK_TTL:
+        return
+    try:
+        await run_subprocess(["docker", "info"])
+    except (subprocess.CalledProcessError, FileNotFoundError):
+        docker_checked_at = None
+        raise HTTPException(status_code=500, detail="Docker daemon is not running. Please start Docker daemon.")
+    docker_checked_at = now
+
+# Builder drivers that can export a registry cache; the default `docker` driver rejects --cache-to outright
+CACHE_EXPORT_DRIVERS = {"docker-container", "kubernetes", "remote"}
+# (time.monotonic() of the last probe, whether the active builder can export a cache), None until probed
+builder_checked = None
+
+# Function to check whether the active buildx builder supports --cache-to, probing it at most once per DOCKER_CHECK_TTL
+async def builder_supports_cache_export():
+    global builder_checked
+    now = time.monotonic()
+    if builder_checked is not None and now - builder_checked[0] < DOCKER_CHECK_TTL:
+        return builder_checked[1]
+    try:
+        output = await run_subprocess(["docker", "buildx", "inspect"])
+    except (subprocess.CalledProcessError, FileNotFoundError):
+        supported = False
+    else:
+        drivers = [line.split(":", 1)[1].strip() for line in output.splitlines() if line.startswith("Driver:")]
+        supported = bool(drivers) and drivers[0] in CACHE_EXPORT_DRIVERS
+    builder_checked = (now, supported)
+    return supported
 
 # Deployment endpoint
 @deploy_router.post("/deploy")
 async def deploy(request: DeployRequest):
     try:
-        # Ensure Docker is running
-        docker_running = subprocess.run(["docker", "info"], capture_output=True, text=True)
-        if docker_running.returncode != 0:
-            raise HTTPException(status_code=500, detail="Docker daemon is not running. Please start Docker daemon.")
-
-        # Ensure AWS CLI is installed
-        aws_cli_installed = subprocess.run(["aws", "--version"], capture_output=True, text=True)
-        if aws_cli_installed.returncode != 0:
-            await install_aws_cli()
-
-        # Step 1: Create a virtual environment
-        subprocess.run(["python3", "-m", "venv", "venv"], check=True)
-
-        # Step 2: Write the Python script to a temporary file
-        temp_dir = "/tmp/deployment"
-        os.makedirs(temp_dir, exist_ok=True)
-        python_script_path = os.path.join(temp_dir, "app.py")
-        with open(python_script_path, "w") as f:
-            f.write(request.python_script)
-
-        # Step 3: Write the requirements to a file
-        requirements_path = os.path.join(temp_dir, "requirements.txt")
-        with open(requirements_path, "w") as f:
-            f.write(request.requirements)
-
-        # Step 4: Install dependencies
-        subprocess.run(["venv/bin/pip", "install", "-r", requirements_path], check=True)
-
-        # Step 5: Create a Dockerfile
-        dockerfile_content = f"""
-        FROM public.ecr.aws/lambda/python:3.8
-        COPY requirements.txt .
-        RUN pip install -r requirements.txt
-        COPY app.py .
-        CMD ["app.lambda_handler"]
-        """
-        dockerfile_path = os.path.join(temp_dir, "Dockerfile")
-        with open(dockerfile_path, "w") as f:
-            f.write(dockerfile_content)
-
-        # Step 6: Build the Docker image
+        # Step 1: Build, tag and push the image while the ECR repository, registry credentials and IAM role are set up
         image_name = f"{request.repository_name}:{request.image_tag}"
-        build_result = subprocess.run(["docker", "build", "-t", image_name, temp_dir], capture_output=True, text=True)
-
-        if build_result.returncode != 0:
-            raise HTTPException(status_code=500, detail=f"Docker build failed: {build_result.stderr}")
-
-        # Step 7: Authenticate Docker to AWS ECR
         region = request.region or os.getenv("AWS_DEFAULT_REGION", "us-west-2")
-        account_id = boto3.client('sts').get_caller_identity().get('Account')
+        account_id = get_account_id()
         ecr_uri = f"{account_id}.dkr.ecr.{region}.amazonaws.com"
-        
-        login_password = subprocess.run(
-            ["aws", "ecr", "get-login-password", "--region", region], 
-            capture_output=True, text=True, check=True
-        ).stdout.strip()
-        
-        login_result = subprocess.run(
-            ["docker", "login", "--username", "AWS", "--password-stdin", ecr_uri],
-            input=login_password, text=True, capture_output=True
-        )
+        role_name = "lambda-execution-role"
+        cache_ref = f"{ecr_uri}/{request.repository_name}:buildcache"
+        inputs_tag = content_tag(request.python_script, request.requirements)
 
-        if login_result.returncode != 0:
-            raise HTTPException(status_code=500, detail=f"Docker login failed: {login_result.stderr}")
+        async def registry_auth():
+            if configure_ecr_credential_helper(ecr_uri):
+                return None
+            username, password = await run_in_threadpool(get_ecr_credentials, region_name=region)
+            return {'username': username, 'password': password}
 
-        # Step 8: Create ECR repository if it doesn't exist
-        ecr_client = boto3.client('ecr', region_name=region)
-        try:
-            ecr_client.create_repository(repositoryName=request.repository_name)
-        except ecr_client.exceptions.RepositoryAlreadyExistsException:
-            pass
+        async def prepare_registry():
+            _, auth_config = await asyncio.gather(
+                run_in_threadpool(create_ecr_repository, request.repository_name, region_name=region),
+                registry_auth()
+            )
+            return auth_config
 
-        # Step 9: Tag and push the Docker image to ECR
-        subprocess.run(["docker", "tag", image_name, f"{ecr_uri}/{image_name}"], check=True)
-        subprocess.run(["docker", "push", f"{ecr_uri}/{image_name}"], check=True)
+        async def build_and_push(registry_ready):
+            if not request.requirements.strip():
+                async with BUILD_SEM:
+                    # Nothing to pip install: layer the script straight onto the cached base image.
+                    # It is committed under the content tag, which concurrent deploys with other inputs can't overwrite.
+                    local_name = f"{request.repository_name}:{inputs_tag}"
+                    await run_in_threadpool(commit_script_image, request.python_script, request.repository_name, inputs_tag)
+                    auth_config = await registry_ready
+                    try:
+                        await run_in_threadpool(
+                            tag_and_push_image, local_name, f"{ecr_uri}/{request.repository_name}", request.image_tag, auth_config
+                        )
+                    except Exception as e:
+                        if MISSING_REPOSITORY_ERROR in str(e):
+                            # Deleted outside this process; the next deploy recreates it
+                            forget_ecr_repository(request.repository_name, region_name=region)
+                        raise
+                    try:
+                        # Record the inputs so an identical redeploy can skip the build
+                        await run_in_threadpool(
+                            tag_and_push_image, local_name, f"{ecr_uri}/{request.repository_name}", inputs_tag, auth_config
+                        )
+                    except Exception as e:
+                        logging.warning(f"Could not record content tag {inputs_tag} for {image_name}: {e}")
+                return
 
-        # Step 10: Create or update the Lambda function
-        role_name = "lambda-execution-role"
-        role_arn = ensure_iam_role(role_name, account_id)
+            # buildx pushes as it builds, so the repository and credentials must be ready first;
+            # wait for them before taking a build slot so the slot isn't idle during ECR calls
+            auth_config = await registry_ready
+            if auth_config:
+                await run_subprocess(
+                    ["docker", "login", "--username", auth_config['username'], "--password-stdin", ecr_uri],
+                    input=auth_config['password']
+                )
+            # The build context is streamed to docker on stdin instead of being written to disk
+            context = make_tar({
+                "app.py": request.python_script.encode(),
+                "requirements.txt": request.requirements.encode(),
+                "Dockerfile": DEPLOY_DOCKERFILE
+            })
+            async with BUILD_SEM:
+                try:
+                    # The content tag is pushed in the same session so it always names the image this build produced
+                    image_uris = [f"{ecr_uri}/{image_name}", f"{ecr_uri}/{request.repository_name}:{inputs_tag}"]
+                    command = build_command(image_uris, "-", cache_ref, await builder_supports_cache_export())
+                    await run_subprocess(command, input=context, env=BUILDKIT_ENV)
+                except subprocess.CalledProcessError as e:
+                    if MISSING_REPOSITORY_ERROR in e.stderr:
+                        # Deleted outside this process; the next deploy recreates it
+                        forget_ecr_repository(request.repository_name, region_name=region)
+                    raise HTTPException(status_code=500, detail=f"Docker build failed: {e.stderr}")
 
-        lambda_client = boto3.client('lambda', region_name=region)
-        function_name = request.function_name
+        role_task = asyncio.ensure_future(run_in_threadpool(ensure_iam_role, role_name, account_id))
+        tasks = [role_task]
         try:
-            response = lambda_client.create_function(
-                FunctionName=function_name,
-                Role=role_arn,
-                Code={
-                    'ImageUri': f"{ecr_uri}/{image_name}"
-                },
-                PackageType='Image',
-                Publish=True,
-                MemorySize=request.memory_size,
-                EphemeralStorage={
-                    'Size': request.storage_size
-                },
-                Environment={
-                    'Variables': request.environment_variables or {}
-                },
-                VpcConfig={
-                    'SubnetIds': request.subnet_ids or [],
-                    'SecurityGroupIds': request.security_group_ids or []
-                } if request.vpc_id else {}
-            )
-        except lambda_client.exceptions.ResourceConflictException:
-            response = lambda_client.update_function_code(
-                FunctionName=function_name,
-                ImageUri=f"{ecr_uri}/{image_name}",
-                Publish=True
-            )
-            if request.vpc_id:
-                lambda_client.update_function_configuration(
-                    FunctionName=function_name,
-                    MemorySize=request.memory_size,
-                    EphemeralStorage={
-                        'Size': request.storage_size
-                    },
-                    Environment={
-                        'Variables': request.environment_variables or {}
-                    },
-                    VpcConfig={
-                        'SubnetIds': request.subnet_ids or [],
-                        'SecurityGroupIds': request.security_group_ids or []
-                    }
-                )
+            # If identical inputs were deployed before, point the requested tag at that image and skip docker entirely
+            try:
+                reused = await run_in_threadpool(tag_ecr_image, request.repository_name, inputs_tag, request.image_tag, region_name=region)
+            except ClientError as e:
+                # The lookup is only an optimisation (e.g. a push-only policy lacks ecr:BatchGetImage); build as usual
+                logging.warning(f"Skipping content tag lookup for {image_name}: {e}")
+                reused = False
+            if not reused:
+                await ensure_docker_running()
+                registry_ready = asyncio.ensure_future(prepare_registry())
+                tasks += [registry_ready, asyncio.ensure_future(build_and_push(registry_ready))]
+                await asyncio.gather(*tasks)
+            role_arn = await role_task
+        finally:
+            # On failure, stop the sibling steps so no build keeps running (and holding BUILD_SEM) after we return
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        # Step 2: Create or update the Lambda function
+        vpc_config = {
+            'SubnetIds': request.subnet_ids or [],
+            'SecurityGroupIds': request.security_group_ids or []
+        } if request.vpc_id else None
+        response = await run_in_threadpool(
+            create_or_update_lambda_function,
+            request.function_name, f"{ecr_uri}/{image_name}", role_arn, region_name=region,
+            memory_size=request.memory_size, storage_size=request.storage_size, vpc_config=vpc_config,
+            environment_variables=request.environment_variables or {}
+        )
 
         return {"message": "Deployment successful", "image_uri": f"{ecr_uri}/{image_name}", "lambda_arn": response['FunctionArn']}
+    except HTTPException:
+        raise
     except subprocess.CalledProcessError as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        raise HTTPException(status_code=500, detail=e.stderr or str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -163,42 +346,34 @@ async def deploy(request: DeployRequest):
 async def advanced_deploy(request: AdvancedDeployRequest, files: List[UploadFile] = File(...)):
     try:
         # Ensure Docker is running
-        docker_running = await run_subprocess("docker info")
-        
-        # Ensure AWS CLI is installed
-        try:
-            await run_subprocess("aws --version")
-        except subprocess.CalledProcessError:
-            await install_aws_cli()
-
-        # Save uploaded files
-        for file in files:
-            file_location = f"./{file.filename}"
-            with open(file_location, "wb+") as file_object:
-                file_object.write(file.file.read())
-
-        # Create Dockerfile with advanced options
-        dockerfile_content = f"""
-        FROM {request.base_image}
-        """
-        for command in request.build_commands:
-            dockerfile_content += f"\nRUN {command}"
-        dockerfile_content += "\nCOPY . ."
-        dockerfile_content += '\nCMD ["app.lambda_handler"]'
-
-        with open("Dockerfile", "w") as f:
-            f.write(dockerfile_content)
-
-        # Build the Docker image
-        image_name = f"{request.repository_name}:{request.image_tag}"
-        build_result = await run_subprocess(f"docker build -t {image_name} .")
+        await ensure_docker_running()
 
-        # Push the Docker image to ECR
-        region = request.region or os.getenv("AWS_DEFAULT_REGION", "us-west-2")
-        image_uri = push_docker_image_to_ecr(request.repository_name, request.image_tag, region_name=region)
+        with tempfile.TemporaryDirectory(prefix="advanced-deploy-") as build_dir:
+            # Save uploaded files into a per-request build context
+            for file in files:
+                file_name = os.path.basename(file.filename or "")
+                if not file_name:
+                    raise HTTPException(status_code=400, detail="Uploaded files must have a file name.")
+                await run_in_threadpool(save_upload, file, os.path.join(build_dir, file_name))
+
+            # Create Dockerfile with advanced options
+            dockerfile_lines = [f"FROM {request.base_image}"]
+            dockerfile_lines += [f"RUN {command}" for command in request.build_commands]
+            dockerfile_lines += ["COPY . .", 'CMD ["app.lambda_handler"]']
+            write_file(os.path.join(build_dir, "Dockerfile"), ("\n".join(dockerfile_lines) + "\n").encode())
+
+            # Build the Docker image and push it to ECR
+            image_name = f"{request.repository_name}:{request.image_tag}"
+            region = request.region or os.getenv("AWS_DEFAULT_REGION", "us-west-2")
+            async with BUILD_SEM:
+                try:
+                    await run_subprocess(["docker", "build", "-t", image_name, build_dir])
+                except subprocess.CalledProcessError as e:
+                    raise HTTPException(status_code=500, detail=f"Docker build failed: {e.stderr}")
+                image_uri = await run_in_threadpool(push_docker_image_to_ecr, request.repository_name, request.image_tag, region_name=region)
 
         # Ensure IAM role exists
-        account_id = boto3.client('sts').get_caller_identity().get('Account')
+        account_id = get_account_id()
         role_arn = ensure_iam_role("lambda-execution-role", account_id)
 
         # Create or update the Lambda function
@@ -206,11 +381,14 @@ async def advanced_deploy(request: AdvancedDeployRequest, files: List[UploadFile
             'SubnetIds': request.subnet_ids or [],
             'SecurityGroupIds': request.security_group_ids or []
         } if request.vpc_id else None
-        response = create_or_update_lambda_function(
+        response = await run_in_threadpool(
+            create_or_update_lambda_function,
             request.function_name, image_uri, role_arn, region_name=region,
             memory_size=128, storage_size=512, vpc_config=vpc_config
         )
 
         return {"message": "Advanced deployment successful", "image_uri": image_uri, "lambda_arn": response['FunctionArn']}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
@@ -1,22 +1,52 @@
 # base_models.py
-from pydantic import BaseModel, Field
+import re
+from pydantic import BaseModel, ConfigDict, Field, field_validator
 from typing import Optional, List, Dict
 
+# Repository names accepted by ECR: slash-separated lowercase components joined by '.', '_' or '-'
+ECR_REPOSITORY_PATTERN = re.compile(r"(?:[a-z0-9]+(?:[._-][a-z0-9]+)*/)*[a-z0-9]+(?:[._-][a-z0-9]+)*")
+# Image tags accepted by Docker and ECR
+IMAGE_TAG_PATTERN = re.compile(r"[A-Za-z0-9_][A-Za-z0-9_.-]{0,127}")
+
+def validate_repository_name(value: str) -> str:
+    if not 2 <= len(value) <= 256 or not ECR_REPOSITORY_PATTERN.fullmatch(value):
+        raise ValueError("must be 2-256 lowercase letters, digits, '.', '_', '-' or '/' and start and end with a letter or digit")
+    return value
+
+def validate_image_tag(value: str) -> str:
+    if not IMAGE_TAG_PATTERN.fullmatch(value):
+        raise ValueError("must be at most 128 letters, digits, '_', '.' or '-' and not start with '.' or '-'")
+    return value
+
 class DeployRequest(BaseModel):
+    model_config = ConfigDict(strict=True)
+
     repository_name: str
     image_tag: str
     python_script: str
     requirements: str
     function_name: str
-    memory_size: Optional[int] = 128
-    storage_size: Optional[int] = 512
+    memory_size: int = Field(128, ge=128, le=10240)
+    storage_size: int = Field(512, ge=512, le=10240)
     region: Optional[str] = None
     vpc_id: Optional[str] = None
     subnet_ids: Optional[List[str]] = None
     security_group_ids: Optional[List[str]] = None
     environment_variables: Optional[Dict[str, str]] = None 
 
+    _check_repository_name = field_validator("repository_name")(validate_repository_name)
+    _check_image_tag = field_validator("image_tag")(validate_image_tag)
+
+    @field_validator("python_script")
+    @classmethod
+    def check_python_script(cls, value: str) -> str:
+        if not value.strip():
+            raise ValueError("must not be empty")
+        return value
+
 class AdvancedDeployRequest(BaseModel):
+    model_config = ConfigDict(strict=True)
+
     repository_name: str
     image_tag: str
     base_image: str
@@ -27,6 +57,9 @@ class AdvancedDeployRequest(BaseModel):
     subnet_ids: Optional[List[str]] = None
     security_group_ids: Optional[List[str]] = None
 
+    _check_repository_name = field_validator("repository_name")(validate_repository_name)
+    _check_image_tag = field_validator("image_tag")(validate_image_tag)
+
 
 class VpcConfig(BaseModel):
     vpc_id: str
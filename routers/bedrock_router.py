@@ -1,7 +1,7 @@
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 from typing import Optional
-import boto3
+from services.aws_services import get_aws_client
 import json
 
 router = APIRouter()
@@ -16,7 +16,7 @@ class BedrockModelRequest(BaseModel):
 async def list_foundation_models(region: Optional[str] = None):
     try:
         region = region or os.getenv("AWS_DEFAULT_REGION", "us-west-2")
-        bedrock_client = boto3.client('bedrock', region_name=region)
+        bedrock_client = get_aws_client('bedrock', region_name=region)
         response = bedrock_client.list_foundation_models()
         models = response['modelSummaries']
         return {"models": models}
@@ -27,7 +27,7 @@ async def list_foundation_models(region: Optional[str] = None):
 async def invoke_model(model_request: BedrockModelRequest, model_id: str, region: Optional[str] = None):
     try:
         region = region or os.getenv("AWS_DEFAULT_REGION", "us-west-2")
-        bedrock_runtime_client = boto3.client('bedrock-runtime', region_name=region)
+        bedrock_runtime_client = get_aws_client('bedrock-runtime', region_name=region)
         body = json.dumps({
             "prompt": model_request.prompt,
             "max_tokens_to_sample": model_request.max_tokens_to_sample,
@@ -1,7 +1,7 @@
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 from typing import List
-import boto3
+from services.aws_services import get_aws_client
 
 router = APIRouter()
 
@@ -16,7 +16,7 @@ class BudgetRequest(BaseModel):
 @router.post("/get-cost-and-usage")
 async def get_cost_and_usage(time_period: TimePeriod, metrics: List[str] = ["UnblendedCost"], granularity: str = "MONTHLY"):
     try:
-        client = boto3.client('ce')
+        client = get_aws_client('ce')
         response = client.get_cost_and_usage(
             TimePeriod={
                 'Start': time_period.Start,
@@ -32,7 +32,7 @@ async def get_cost_and_usage(time_period: TimePeriod, metrics: List[str] = ["Unb
 @router.post("/describe-budget")
 async def describe_budget(budget_request: BudgetRequest):
     try:
-        client = boto3.client('budgets')
+        client = get_aws_client('budgets')
         response = client.describe_budget(
             AccountId=budget_request.AccountId,
             BudgetName=budget_request.BudgetName
@@ -44,7 +44,7 @@ async def describe_budget(budget_request: BudgetRequest):
 @router.get("/describe-report-definitions")
 async def describe_report_definitions():
     try:
-        client = boto3.client('cur')
+        client = get_aws_client('cur')
         response = client.describe_report_definitions()
         return response['ReportDefinitions']
     except Exception as e:
@@ -53,7 +53,7 @@ async def describe_report_definitions():
 @router.post("/get-products")
 async def get_products(service_code: str, filters: List[dict]):
     try:
-        client = boto3.client('pricing')
+        client = get_aws_client('pricing')
         response = client.get_products(
             ServiceCode=service_code,
             Filters=filters
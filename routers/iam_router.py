@@ -1,7 +1,7 @@
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 from typing import Optional, List
-import boto3
+from services.aws_services import get_aws_client
 from botocore.exceptions import ClientError
 import json
 
@@ -28,7 +28,7 @@ class AccessKeyRequest(BaseModel):
 @router.post("/create-user")
 async def create_user(request: IAMUserRequest):
     try:
-        iam_client = boto3.client('iam')
+        iam_client = get_aws_client('iam')
         response = iam_client.create_user(UserName=request.user_name)
         return response
     except ClientError as e:
@@ -37,7 +37,7 @@ async def create_user(request: IAMUserRequest):
 @router.get("/list-users")
 async def list_users():
     try:
-        iam_client = boto3.client('iam')
+        iam_client = get_aws_client('iam')
         paginator = iam_client.get_paginator('list_users')
         users = []
         for response in paginator.paginate():
@@ -49,7 +49,7 @@ async def list_users():
 @router.post("/create-role")
 async def create_role(request: IAMRoleRequest):
     try:
-        iam_client = boto3.client('iam')
+        iam_client = get_aws_client('iam')
         response = iam_client.create_role(
             RoleName=request.role_name,
             AssumeRolePolicyDocument=json.dumps(request.assume_role_policy_document)
@@ -61,7 +61,7 @@ async def create_role(request: IAMRoleRequest):
 @router.post("/attach-policy-to-role")
 async def attach_policy_to_role(role_name: str, policy_arn: str):
     try:
-        iam_client = boto3.client('iam')
+        iam_client = get_aws_client('iam')
         response = iam_client.attach_role_policy(RoleName=role_name, PolicyArn=policy_arn)
         return response
     except ClientError as e:
@@ -70,7 +70,7 @@ async def attach_policy_to_role(role_name: str, policy_arn: str):
 @router.post("/create-policy")
 async def create_policy(request: IAMPolicyRequest):
     try:
-        iam_client = boto3.client('iam')
+        iam_client = get_aws_client('iam')
         response = iam_client.create_policy(
             PolicyName=request.policy_name,
             PolicyDocument=json.dumps(request.policy_document)
@@ -82,7 +82,7 @@ async def create_policy(request: IAMPolicyRequest):
 @router.post("/assume-role")
 async def assume_role(request: AssumeRoleRequest):
     try:
-        sts_client = boto3.client('sts')
+        sts_client = get_aws_client('sts')
         response = sts_client.assume_role(
             RoleArn=request.role_arn,
             RoleSessionName=request.role_session_name
@@ -94,7 +94,7 @@ async def assume_role(request: AssumeRoleRequest):
 @router.post("/create-access-key")
 async def create_access_key(request: AccessKeyRequest):
     try:
-        iam_client = boto3.client('iam')
+        iam_client = get_aws_client('iam')
         response = iam_client.create_access_key(UserName=request.user_name)
         return response['AccessKey']
     except ClientError as e:
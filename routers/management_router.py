@@ -1,13 +1,15 @@
 from fastapi import APIRouter, HTTPException, Depends, status
 from pydantic import BaseModel
 from typing import Optional, List, Dict
-import boto3
 from botocore.exceptions import ClientError
 import json
 import os
 
 from models.base_models import SingleInvokeConfig, MultipleInvokeConfig
 from services.aws_services import (
+    get_aws_client,
+    get_account_id,
+    forget_ecr_repository,
     list_s3_buckets,
     upload_file_to_s3,
     create_ec2_instance,
@@ -39,28 +41,19 @@ class UpdateFunctionConfig(BaseModel):
 async def deploy_multiple_functions(config: FunctionConfig, current_user: dict = Depends(get_current_user)):
     try:
         # Initialize AWS clients
-        account_id = boto3.client('sts').get_caller_identity().get('Account')
+        account_id = get_account_id()
         region = config.region or os.getenv("AWS_DEFAULT_REGION", "us-west-2")
-        ecr_client = boto3.client('ecr', region_name=region)
-        lambda_client = boto3.client('lambda', region_name=region)
-        logs_client = boto3.client('logs', region_name=region)
-        sns_client = boto3.client('sns', region_name=region)
+        ecr_client = get_aws_client('ecr', region_name=region)
+        lambda_client = get_aws_client('lambda', region_name=region)
+        logs_client = get_aws_client('logs', region_name=region)
+        sns_client = get_aws_client('sns', region_name=region)
 
         # Ensure the IAM role exists
         role_name = "lambda-execution-role"
         role_arn = await ensure_iam_role(role_name, account_id)
 
-        # Authenticate Docker to AWS ECR
+        # Functions pull their image from ECR directly; no docker login is needed here
         ecr_uri = f"{account_id}.dkr.ecr.{region}.amazonaws.com"
-        login_password = subprocess.run(
-            ["aws", "ecr", "get-login-password", "--region", region],
-            capture_output=True, text=True, check=True
-        ).stdout.strip()
-        
-        subprocess.run(
-            ["docker", "login", "--username", "AWS", "--password-stdin", ecr_uri],
-            input=login_password, text=True, capture_output=True
-        )
 
         # Ensure ECR repository exists
         try:
@@ -125,7 +118,7 @@ async def invoke_lambda(config: SingleInvokeConfig, current_user: dict = Depends
     try:
         # Initialize boto3 Lambda client
         region = config.region or os.getenv("AWS_DEFAULT_REGION", "us-west-2")
-        lambda_client = boto3.client('lambda', region_name=region)
+        lambda_client = get_aws_client('lambda', region_name=region)
         
         # Invoke the Lambda function
         response = lambda_client.invoke(
@@ -147,7 +140,7 @@ async def invoke_multiple_functions(config: MultipleInvokeConfig, current_user:
     try:
         # Initialize AWS Lambda client
         region = config.region or os.getenv("AWS_DEFAULT_REGION", "us-west-2")
-        lambda_client = boto3.client('lambda', region_name=region)
+        lambda_client = get_aws_client('lambda', region_name=region)
 
         responses = []
 
@@ -179,11 +172,11 @@ async def invoke_multiple_functions(config: MultipleInvokeConfig, current_user:
 async def list_lambda_functions(region: Optional[str] = None, current_user: dict = Depends(get_current_user)):
     try:
         if region:
-            lambda_client = boto3.client('lambda', region_name=region)
+            lambda_client = get_aws_client('lambda', region_name=region)
             response = lambda_client.list_functions()
             functions = response['Functions']
         else:
-            lambda_client = boto3.client('lambda')
+            lambda_client = get_aws_client('lambda')
             paginator = lambda_client.get_paginator('list_functions')
             response_iterator = paginator.paginate()
             functions = []
@@ -201,7 +194,7 @@ async def delete_lambda_function(function_name: str, current_user: dict = Depend
     try:
         # Initialize boto3 Lambda client
         region = "us-west-2"  # Change to your desired region
-        lambda_client = boto3.client('lambda', region_name=region)
+        lambda_client = get_aws_client('lambda', region_name=region)
         
         # Delete the Lambda function
         lambda_client.delete_function(FunctionName=function_name)
@@ -215,7 +208,7 @@ async def list_ecr_repositories(current_user: dict = Depends(get_current_user)):
     try:
         # Initialize boto3 ECR client
         region = "us-west-2"  # Change to your desired region
-        ecr_client = boto3.client('ecr', region_name=region)
+        ecr_client = get_aws_client('ecr', region_name=region)
         
         # List ECR repositories
         response = ecr_client.describe_repositories()
@@ -230,10 +223,11 @@ async def delete_ecr_repository(repository_name: str, current_user: dict = Depen
     try:
         # Initialize boto3 ECR client
         region = "us-west-2"  # Change to your desired region
-        ecr_client = boto3.client('ecr', region_name=region)
+        ecr_client = get_aws_client('ecr', region_name=region)
         
         # Delete the ECR repository
         ecr_client.delete_repository(repositoryName=repository_name, force=True)
+        forget_ecr_repository(repository_name, region_name=region)
 
         return {"message": f"ECR repository {repository_name} deleted successfully."}
     except ClientError as e:
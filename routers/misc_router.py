@@ -1,12 +1,12 @@
 from fastapi import APIRouter, HTTPException
-import boto3
+from services.aws_services import get_aws_client
 
 router = APIRouter()
 
 @router.get("/regions")
 async def list_regions():
     try:
-        ec2_client = boto3.client('ec2')
+        ec2_client = get_aws_client('ec2')
         response = ec2_client.describe_regions()
         regions = response['Regions']
         region_names = [region['RegionName'] for region in regions]
@@ -1,24 +1,61 @@
 # aws_services.py
 
 import boto3
+import docker
 import json
-import subprocess
 from botocore.exceptions import ClientError
 import base64
+import threading
+import time
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
+
+# One session for the whole process; client creation on it is serialized because Sessions are not thread-safe
+_SESSION = boto3.Session()
+_SESSION_LOCK = threading.Lock()
+
+# Account IDs keyed by profile; the caller identity never changes for the process lifetime
+_ACCOUNT_ID_CACHE: Dict[str, str] = {}
+
+# Seconds a resource seen to exist is trusted before AWS is asked again
+EXISTENCE_TTL = 300
+# (region, repository name) -> (time.monotonic() when seen, describe_repositories response)
+_REPOSITORY_CACHE: Dict[Tuple[Optional[str], str], Tuple[float, dict]] = {}
+# (region, function name) -> time.monotonic() when the function was seen
+_FUNCTION_CACHE: Dict[Tuple[Optional[str], str], float] = {}
 
 # Function to initialize an AWS client
+@lru_cache(maxsize=32)
 def get_aws_client(service_name, region_name=None):
     """
-    Initialize an AWS client for a given service.
+    Initialize an AWS client for a given service, creating it only once per service and region.
 
     Args:
         service_name (str): The name of the AWS service (e.g., 's3', 'ec2').
         region_name (str, optional): The AWS region. If not provided, uses the default region.
 
     Returns:
-        boto3.client: The Boto3 client for the specified service.
+        boto3.client: The shared Boto3 client for the specified service.
     """
-    return boto3.client(service_name, region_name=region_name)
+    with _SESSION_LOCK:
+        return _SESSION.client(service_name, region_name=region_name)
+
+# Function to get the AWS account ID, calling STS only once per profile
+def get_account_id(profile: Optional[str] = None):
+    """
+    Get the AWS account ID of the current credentials.
+
+    Args:
+        profile (str, optional): The AWS profile name. If not provided, uses the default profile.
+
+    Returns:
+        str: The AWS account ID.
+    """
+    key = profile or "default"
+    if key not in _ACCOUNT_ID_CACHE:
+        sts_client = boto3.Session(profile_name=profile).client('sts') if profile else get_aws_client('sts')
+        _ACCOUNT_ID_CACHE[key] = sts_client.get_caller_identity()['Account']
+    return _ACCOUNT_ID_CACHE[key]
 
 # Function to ensure IAM role exists, creating it if it does not
 def ensure_iam_role(role_name, account_id, service='lambda.amazonaws.com'):
@@ -67,17 +104,127 @@ def create_ecr_repository(repository_name, region_name=None):
         region_name (str, optional): The AWS region. If not provided, uses the default region.
 
     Returns:
-        dict: The response from the create_repository call.
+        dict: The response from the describe_repositories or create_repository call.
     """
+    key = (region_name, repository_name)
+    cached = _REPOSITORY_CACHE.get(key)
+    if cached and time.monotonic() - cached[0] < EXISTENCE_TTL:
+        return cached[1]
+
     ecr_client = get_aws_client('ecr', region_name=region_name)
     try:
-        response = ecr_client.create_repository(repositoryName=repository_name)
-    except ecr_client.exceptions.RepositoryAlreadyExistsException:
         response = ecr_client.describe_repositories(repositoryNames=[repository_name])
+    except ecr_client.exceptions.RepositoryNotFoundException:
+        try:
+            response = ecr_client.create_repository(repositoryName=repository_name)
+        except ecr_client.exceptions.RepositoryAlreadyExistsException:
+            # Created concurrently by another deploy since the describe call
+            response = ecr_client.describe_repositories(repositoryNames=[repository_name])
+    _REPOSITORY_CACHE[key] = (time.monotonic(), response)
     return response
 
-# Function to push a Docker image to ECR
+# Function to drop a repository from the existence cache after it is deleted
+def forget_ecr_repository(repository_name, region_name=None):
+    """
+    Forget that an ECR repository exists so the next deploy checks AWS again.
+
+    Args:
+        repository_name (str): The name of the ECR repository.
+        region_name (str, optional): The AWS region. If not provided, uses the default region.
+    """
+    _REPOSITORY_CACHE.pop((region_name, repository_name), None)
+
+# Function to add a tag to an image already in ECR without pulling or pushing any layers
+def tag_ecr_image(repository_name, source_tag, target_tag, region_name=None):
+    """
+    Point an additional tag at an existing ECR image by re-putting its manifest.
+
+    Args:
+        repository_name (str): The name of the ECR repository.
+        source_tag (str): The tag of the existing image.
+        target_tag (str): The tag to add.
+        region_name (str, optional): The AWS region. If not provided, uses the default region.
+
+    Returns:
+        bool: True if the tag now points at the image, False if there is no image with the source tag.
+    """
+    ecr_client = get_aws_client('ecr', region_name=region_name)
+    try:
+        response = ecr_client.batch_get_image(repositoryName=repository_name, imageIds=[{'imageTag': source_tag}])
+    except ecr_client.exceptions.RepositoryNotFoundException:
+        # Deleted outside this process; make the next create_ecr_repository call check again
+        forget_ecr_repository(repository_name, region_name=region_name)
+        return False
+    if not response['images']:
+        # Missing tags are reported in 'failures' rather than raised
+        return False
+    if source_tag == target_tag:
+        return True
+    image = response['images'][0]
+    put_kwargs = {'imageManifestMediaType': image['imageManifestMediaType']} if 'imageManifestMediaType' in image else {}
+    try:
+        ecr_client.put_image(
+            repositoryName=repository_name,
+            imageManifest=image['imageManifest'],
+            imageTag=target_tag,
+            **put_kwargs
+        )
+    except ecr_client.exceptions.ImageAlreadyExistsException:
+        pass
+    return True
+
+# Function to fetch ECR registry credentials without shelling out to the AWS CLI
+def get_ecr_credentials(region_name=None):
+    """
+    Get Docker registry credentials for ECR from GetAuthorizationToken.
+
+    Args:
+        region_name (str, optional): The AWS region. If not provided, uses the default region.
+
+    Returns:
+        tuple: The (username, password) pair for docker login.
+    """
+    ecr_client = get_aws_client('ecr', region_name=region_name)
+    auth_token = ecr_client.get_authorization_token()['authorizationData'][0]['authorizationToken']
+    username, password = base64.b64decode(auth_token).decode().split(':', 1)
+    return username, password
+
+# Function to get a Docker Engine API client shared across requests
+@lru_cache(maxsize=1)
+def get_docker_client():
+    """
+    Get a Docker client talking to the local daemon socket, created once per process.
+
+    Returns:
+        docker.DockerClient: The shared Docker client.
+    """
+    return docker.from_env()
+
+# Function to tag a local image and push it through the Docker Engine API
+def tag_and_push_image(image_name, repository_uri, image_tag, auth_config=None):
+    """
+    Tag a local Docker image and push it to a registry without invoking the docker CLI.
 
+    Args:
+        image_name (str): The local image reference (e.g., 'my-repo:latest').
+        repository_uri (str): The registry repository to push to.
+        image_tag (str): The tag to push.
+        auth_config (dict, optional): Registry credentials. If not provided, the Docker config (e.g., credential helpers) is used.
+
+    Returns:
+        str: The URI of the pushed Docker image.
+    """
+    client = get_docker_client()
+    if auth_config is None:
+        # Pick up credential helpers registered after the client was created
+        client.api.reload_config()
+    client.images.get(image_name).tag(repository_uri, image_tag)
+    for line in client.images.push(repository_uri, tag=image_tag, stream=True, decode=True, auth_config=auth_config):
+        if 'error' in line:
+            raise Exception(f"Docker push failed: {line['error']}")
+    return f"{repository_uri}:{image_tag}"
+
+# Function to push a Docker image to ECR
 def push_docker_image_to_ecr(repository_name, image_tag, region_name=None):
     """
     Push a Docker image to an ECR repository.
@@ -90,27 +237,45 @@ def push_docker_image_to_ecr(repository_name, image_tag, region_name=None):
     Returns:
         str: The URI of the pushed Docker image.
     """
-    ecr_client = get_aws_client('ecr', region_name=region_name)
-    account_id = boto3.client('sts').get_caller_identity().get('Account')
+    account_id = get_account_id()
     ecr_uri = f"{account_id}.dkr.ecr.{region_name}.amazonaws.com"
     
-    # Get ECR login token and authenticate Docker
-    auth_token = ecr_client.get_authorization_token()['authorizationData'][0]['authorizationToken']
-    username, password = base64.b64decode(auth_token).decode().split(':')
-    
-    login_command = f"docker login -u {username} -p {password} {ecr_uri}"
-    login_result = subprocess.run(login_command, shell=True, capture_output=True, text=True)
-    if login_result.returncode != 0:
-        raise Exception(f"Docker login failed: {login_result.stderr}")
+    # Get ECR login token for the push
+    username, password = get_ecr_credentials(region_name=region_name)
     
-    image_uri = f"{ecr_uri}/{repository_name}:{image_tag}"
-    subprocess.run(["docker", "tag", f"{repository_name}:{image_tag}", image_uri], check=True)
-    subprocess.run(["docker", "push", image_uri], check=True)
-    
-    return image_uri
+    return tag_and_push_image(
+        f"{repository_name}:{image_tag}", f"{ecr_uri}/{repository_name}", image_tag,
+        auth_config={'username': username, 'password': password}
+    )
+
+# Function to check whether a Lambda function exists, trusting a recent positive answer
+def lambda_function_exists(function_name, region_name=None):
+    """
+    Check whether a Lambda function exists.
+
+    Args:
+        function_name (str): The name of the Lambda function.
+        region_name (str, optional): The AWS region. If not provided, uses the default region.
+
+    Returns:
+        bool: True if the function exists.
+    """
+    key = (region_name, function_name)
+    seen_at = _FUNCTION_CACHE.get(key)
+    if seen_at is not None and time.monotonic() - seen_at < EXISTENCE_TTL:
+        return True
+
+    lambda_client = get_aws_client('lambda', region_name=region_name)
+    try:
+        lambda_client.get_function(FunctionName=function_name)
+    except lambda_client.exceptions.ResourceNotFoundException:
+        _FUNCTION_CACHE.pop(key, None)
+        return False
+    _FUNCTION_CACHE[key] = time.monotonic()
+    return True
 
 # Function to create or update a Lambda function with a Docker image
-def create_or_update_lambda_function(function_name, image_uri, role_arn, region_name=None, memory_size=128, storage_size=512, vpc_config=None):
+def create_or_update_lambda_function(function_name, image_uri, role_arn, region_name=None, memory_size=128, storage_size=512, vpc_config=None, environment_variables=None):
     """
     Create or update a Lambda function with a Docker image.
 
@@ -122,23 +287,15 @@ def create_or_update_lambda_function(function_name, image_uri, role_arn, region_
         memory_size (int, optional): The memory size for the Lambda function (default is 128 MB).
         storage_size (int, optional): The ephemeral storage size for the Lambda function (default is 512 MB).
         vpc_config (dict, optional): The VPC configuration for the Lambda function (default is None).
+        environment_variables (dict, optional): The environment variables for the Lambda function (default is None).
 
     Returns:
         dict: The response from the create_function or update_function_code call.
     """
     lambda_client = get_aws_client('lambda', region_name=region_name)
-    try:
-        response = lambda_client.create_function(
-            FunctionName=function_name,
-            Role=role_arn,
-            Code={'ImageUri': image_uri},
-            PackageType='Image',
-            Publish=True,
-            MemorySize=memory_size,
-            EphemeralStorage={'Size': storage_size},
-            VpcConfig=vpc_config if vpc_config else {}
-        )
-    except lambda_client.exceptions.ResourceConflictException:
+    environment = {'Environment': {'Variables': environment_variables}} if environment_variables is not None else {}
+
+    def update_function():
         response = lambda_client.update_function_code(
             FunctionName=function_name,
             ImageUri=image_uri,
@@ -149,8 +306,34 @@ def create_or_update_lambda_function(function_name, image_uri, role_arn, region_
                 FunctionName=function_name,
                 MemorySize=memory_size,
                 EphemeralStorage={'Size': storage_size},
-                VpcConfig=vpc_config
+                VpcConfig=vpc_config,
+                **environment
             )
+        return response
+
+    if lambda_function_exists(function_name, region_name=region_name):
+        try:
+            return update_function()
+        except lambda_client.exceptions.ResourceNotFoundException:
+            # Deleted since it was last seen; fall through to creating it
+            _FUNCTION_CACHE.pop((region_name, function_name), None)
+
+    try:
+        response = lambda_client.create_function(
+            FunctionName=function_name,
+            Role=role_arn,
+            Code={'ImageUri': image_uri},
+            PackageType='Image',
+            Publish=True,
+            MemorySize=memory_size,
+            EphemeralStorage={'Size': storage_size},
+            VpcConfig=vpc_config if vpc_config else {},
+            **environment
+        )
+    except lambda_client.exceptions.ResourceConflictException:
+        # Created concurrently by another deploy since the existence check
+        response = update_function()
+    _FUNCTION_CACHE[(region_name, function_name)] = time.monotonic()
     return response
 
 # Additional utility functions can be added here for other AWS services...
@@ -0,0 +1,144 @@
+import boto3
+import pytest
+from botocore.stub import Stubber
+from services import aws_services
+from deployment.aws.deploy import content_tag
+
+REGION = "us-west-2"
+IMAGE_URI = "123456789012.dkr.ecr.us-west-2.amazonaws.com/my-repository:latest"
+ROLE_ARN = "arn:aws:iam::123456789012:role/lambda-execution-role"
+FUNCTION_ARN = "arn:aws:lambda:us-west-2:123456789012:function:my-function"
+REPOSITORY = {"repositories": [{"repositoryName": "my-repository"}]}
+IMAGE = {
+    "repositoryName": "my-repository",
+    "imageId": {"imageTag": "sha256-0123456789abcdef"},
+    "imageManifest": "{}",
+    "imageManifestMediaType": "application/vnd.docker.distribution.manifest.v2+json",
+}
+
+@pytest.fixture
+def stub(monkeypatch):
+    """Route get_aws_client to stubbed clients and start each test with empty existence caches."""
+    stubbers = {}
+
+    def get_stubber(service_name):
+        if service_name not in stubbers:
+            client = boto3.client(
+                service_name, region_name=REGION, aws_access_key_id="testing", aws_secret_access_key="testing"
+            )
+            stubbers[service_name] = Stubber(client)
+            stubbers[service_name].activate()
+        return stubbers[service_name]
+
+    monkeypatch.setattr(aws_services, "get_aws_client", lambda service_name, region_name=None: get_stubber(service_name).client)
+    monkeypatch.setattr(aws_services, "_REPOSITORY_CACHE", {})
+    monkeypatch.setattr(aws_services, "_FUNCTION_CACHE", {})
+    yield get_stubber
+    for stubber in stubbers.values():
+        stubber.assert_no_pending_responses()
+
+def test_content_tag_is_stable_and_input_sensitive():
+    tag = content_tag("print('hi')", "requests")
+    assert tag == content_tag("print('hi')", "requests")
+    assert tag.startswith("sha256-") and len(tag) == len("sha256-") + 16
+    assert tag != content_tag("print('hi')", "boto3")
+    # Moving bytes between the script and the requirements must change the tag
+    assert content_tag("ab", "c") != content_tag("a", "bc")
+
+def test_tag_ecr_image_hit_puts_manifest_under_new_tag(stub):
+    ecr = stub("ecr")
+    ecr.add_response("batch_get_image", {"images": [IMAGE], "failures": []},
+                     {"repositoryName": "my-repository", "imageIds": [{"imageTag": "sha256-0123456789abcdef"}]})
+    ecr.add_response("put_image", {"image": IMAGE}, {
+        "repositoryName": "my-repository",
+        "imageManifest": "{}",
+        "imageTag": "latest",
+        "imageManifestMediaType": IMAGE["imageManifestMediaType"],
+    })
+    assert aws_services.tag_ecr_image("my-repository", "sha256-0123456789abcdef", "latest", region_name=REGION)
+
+def test_tag_ecr_image_tolerates_existing_tag(stub):
+    ecr = stub("ecr")
+    ecr.add_response("batch_get_image", {"images": [IMAGE], "failures": []})
+    ecr.add_client_error("put_image", "ImageAlreadyExistsException")
+    assert aws_services.tag_ecr_image("my-repository", "sha256-0123456789abcdef", "latest", region_name=REGION)
+
+def test_tag_ecr_image_same_tag_only_checks_existence(stub):
+    stub("ecr").add_response("batch_get_image", {"images": [IMAGE], "failures": []})
+    assert aws_services.tag_ecr_image("my-repository", "latest", "latest", region_name=REGION)
+
+def test_tag_ecr_image_miss_reported_in_failures(stub):
+    stub("ecr").add_response("batch_get_image", {"images": [], "failures": [{
+        "imageId": {"imageTag": "sha256-0123456789abcdef"},
+        "failureCode": "ImageNotFound",
+        "failureReason": "Requested image not found",
+    }]})
+    assert not aws_services.tag_ecr_image("my-repository", "sha256-0123456789abcdef", "latest", region_name=REGION)
+
+def test_tag_ecr_image_missing_repository_evicts_cache(stub):
+    aws_services._REPOSITORY_CACHE[(REGION, "my-repository")] = (float("inf"), REPOSITORY)
+    stub("ecr").add_client_error("batch_get_image", "RepositoryNotFoundException")
+    assert not aws_services.tag_ecr_image("my-repository", "sha256-0123456789abcdef", "latest", region_name=REGION)
+    assert (REGION, "my-repository") not in aws_services._REPOSITORY_CACHE
+
+def test_create_ecr_repository_caches_existing_repository(stub):
+    stub("ecr").add_response("describe_repositories", REPOSITORY, {"repositoryNames": ["my-repository"]})
+    assert aws_services.create_ecr_repository("my-repository", region_name=REGION) == REPOSITORY
+    # Served from the cache: no second describe_repositories call is stubbed
+    assert aws_services.create_ecr_repository("my-repository", region_name=REGION) == REPOSITORY
+
+def test_create_ecr_repository_creates_missing_repository(stub):
+    ecr = stub("ecr")
+    ecr.add_client_error("describe_repositories", "RepositoryNotFoundException")
+    ecr.add_response("create_repository", {"repository": {"repositoryName": "my-repository"}}, {"repositoryName": "my-repository"})
+    assert aws_services.create_ecr_repository("my-repository", region_name=REGION)["repository"]["repositoryName"] == "my-repository"
+
+def test_create_ecr_repository_falls_back_when_created_concurrently(stub):
+    ecr = stub("ecr")
+    ecr.add_client_error("describe_repositories", "RepositoryNotFoundException")
+    ecr.add_client_error("create_repository", "RepositoryAlreadyExistsException")
+    ecr.add_response("describe_repositories", REPOSITORY, {"repositoryNames": ["my-repository"]})
+    assert aws_services.create_ecr_repository("my-repository", region_name=REGION) == REPOSITORY
+
+def test_forget_ecr_repository_forces_a_new_check(stub):
+    ecr = stub("ecr")
+    ecr.add_response("describe_repositories", REPOSITORY)
+    ecr.add_response("describe_repositories", REPOSITORY)
+    aws_services.create_ecr_repository("my-repository", region_name=REGION)
+    aws_services.forget_ecr_repository("my-repository", region_name=REGION)
+    aws_services.create_ecr_repository("my-repository", region_name=REGION)
+
+def test_create_or_update_lambda_function_updates_existing_function(stub):
+    lambda_stub = stub("lambda")
+    lambda_stub.add_response("get_function", {"Configuration": {"FunctionName": "my-function"}}, {"FunctionName": "my-function"})
+    lambda_stub.add_response("update_function_code", {"FunctionArn": FUNCTION_ARN},
+                             {"FunctionName": "my-function", "ImageUri": IMAGE_URI, "Publish": True})
+    response = aws_services.create_or_update_lambda_function("my-function", IMAGE_URI, ROLE_ARN, region_name=REGION)
+    assert response["FunctionArn"] == FUNCTION_ARN
+    # The function is now known to exist, so the next deploy goes straight to the update
+    lambda_stub.add_response("update_function_code", {"FunctionArn": FUNCTION_ARN})
+    aws_services.create_or_update_lambda_function("my-function", IMAGE_URI, ROLE_ARN, region_name=REGION)
+
+def test_create_or_update_lambda_function_creates_missing_function(stub):
+    lambda_stub = stub("lambda")
+    lambda_stub.add_client_error("get_function", "ResourceNotFoundException")
+    lambda_stub.add_response("create_function", {"FunctionArn": FUNCTION_ARN})
+    response = aws_services.create_or_update_lambda_function("my-function", IMAGE_URI, ROLE_ARN, region_name=REGION)
+    assert response["FunctionArn"] == FUNCTION_ARN
+    assert (REGION, "my-function") in aws_services._FUNCTION_CACHE
+
+def test_create_or_update_lambda_function_falls_back_when_created_concurrently(stub):
+    lambda_stub = stub("lambda")
+    lambda_stub.add_client_error("get_function", "ResourceNotFoundException")
+    lambda_stub.add_client_error("create_function", "ResourceConflictException")
+    lambda_stub.add_response("update_function_code", {"FunctionArn": FUNCTION_ARN})
+    response = aws_services.create_or_update_lambda_function("my-function", IMAGE_URI, ROLE_ARN, region_name=REGION)
+    assert response["FunctionArn"] == FUNCTION_ARN
+
+def test_create_or_update_lambda_function_recreates_function_deleted_since_cached(stub):
+    aws_services._FUNCTION_CACHE[(REGION, "my-function")] = float("inf")
+    lambda_stub = stub("lambda")
+    lambda_stub.add_client_error("update_function_code", "ResourceNotFoundException")
+    lambda_stub.add_response("create_function", {"FunctionArn": FUNCTION_ARN})
+    response = aws_services.create_or_update_lambda_function("my-function", IMAGE_URI, ROLE_ARN, region_name=REGION)
+    assert response["FunctionArn"] == FUNCTION_ARN
@@ -0,0 +1,41 @@
+import pytest
+from pydantic import ValidationError
+from models.base_models import DeployRequest, AdvancedDeployRequest
+
+VALID_DEPLOY = {
+    "repository_name": "my-repository",
+    "image_tag": "latest",
+    "python_script": "def lambda_handler(event, context):\n    return {'statusCode': 200}",
+    "requirements": "requests",
+    "function_name": "my-lambda-function",
+}
+
+def test_deploy_request_accepts_valid_input():
+    request = DeployRequest(**VALID_DEPLOY)
+    assert request.memory_size == 128
+    assert request.storage_size == 512
+
+@pytest.mark.parametrize("overrides", [
+    {"repository_name": "My-Repository"},
+    {"repository_name": "a"},
+    {"repository_name": "team/-repo"},
+    {"image_tag": ".latest"},
+    {"python_script": "   "},
+    {"memory_size": 64},
+    {"memory_size": 10241},
+    {"storage_size": 256},
+    {"memory_size": "1024"},
+])
+def test_deploy_request_rejects_invalid_input(overrides):
+    with pytest.raises(ValidationError):
+        DeployRequest(**{**VALID_DEPLOY, **overrides})
+
+def test_advanced_deploy_request_validates_repository_name():
+    with pytest.raises(ValidationError):
+        AdvancedDeployRequest(
+            repository_name="Bad Name",
+            image_tag="latest",
+            base_image="public.ecr.aws/lambda/python:3.8",
+            build_commands=[],
+            function_name="my-lambda-function",
+        )
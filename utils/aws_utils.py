@@ -1,7 +1,50 @@
-import subprocess
+import json
+import os
+import shutil
+import tempfile
 
-async def install_aws_cli():
-    subprocess.run(["curl", "https://awscli.amazonaws.com/awscli-exe-linux-x86_64.zip", "-o", "awscliv2.zip"], check=True)
-    subprocess.run(["unzip", "awscliv2.zip"], check=True)
-    subprocess.run(["sudo", "./aws/install"], check=True)
-    subprocess.run(["rm", "-rf", "awscliv2.zip", "aws"], check=True)
+# ECR registries already mapped to the credential helper in this process
+_CONFIGURED_REGISTRIES = set()
+
+def configure_ecr_credential_helper(registry):
+    """
+    Point Docker at docker-credential-ecr-login for an ECR registry.
+
+    Args:
+        registry (str): The ECR registry host (e.g., '123456789012.dkr.ecr.us-west-2.amazonaws.com').
+
+    Returns:
+        bool: True if the credential helper handles the registry, False if it is not installed or the Docker config could not be updated.
+    """
+    if registry in _CONFIGURED_REGISTRIES:
+        return True
+    if shutil.which("docker-credential-ecr-login") is None:
+        return False
+
+    config_dir = os.getenv("DOCKER_CONFIG", os.path.join(os.path.expanduser("~"), ".docker"))
+    config_path = os.path.join(config_dir, "config.json")
+    try:
+        config = {}
+        if os.path.exists(config_path):
+            with open(config_path) as f:
+                config = json.load(f)
+
+        cred_helpers = config.setdefault("credHelpers", {})
+        if cred_helpers.get(registry) != "ecr-login":
+            cred_helpers[registry] = "ecr-login"
+            os.makedirs(config_dir, exist_ok=True)
+            # Other workers and `docker login` read and write this file too, so swap it in atomically
+            fd, tmp_path = tempfile.mkstemp(dir=config_dir, prefix=".config.json.")
+            try:
+                with os.fdopen(fd, "w") as f:
+                    json.dump(config, f, indent=2)
+                os.replace(tmp_path, config_path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+    except (OSError, ValueError):
+        # An unreadable or unwritable config means explicit credentials are needed instead
+        return False
+
+    _CONFIGURED_REGISTRIES.add(registry)
+    return True